@@ -1,13 +1,14 @@
 import enum
 import uuid
 import typing
+import struct
 import reprlib
 import construct
-import itertools
 import dataclasses
+import numpy as np
 from PIL import Image
 import datetime as dt
-from msband.sugar import IntEnumAdapter, EnumBase, csfield
+from msband.sugar import IntEnumAdapter, EnumBase, csfield, PrefixedDataclassStruct
 from construct_typed import DataclassMixin, DataclassStruct, TEnum
 from msband.static.i18n import (
     LocaleId,
@@ -39,8 +40,11 @@ from construct import (
 )
 
 
-# Needed for a weird recursion error
-dataclasses.Field.__repr__ = reprlib.recursive_repr()(dataclasses.Field.__repr__)
+# Needed for a weird recursion error, only wrapped once even if this module gets reloaded
+if not getattr(dataclasses.Field.__repr__, "_msband_patched", False):
+    _field_repr = reprlib.recursive_repr()(dataclasses.Field.__repr__)
+    _field_repr._msband_patched = True
+    dataclasses.Field.__repr__ = _field_repr
 
 
 PUSH_SERVICE = uuid.UUID(hex="d8895bfd-0461-400d-bd52-dbe2a3c33021")
@@ -48,20 +52,24 @@ BAND_APP_IOS = uuid.UUID(hex="090fa552-5e0c-a24d-803b-af536cf97da3")
 
 
 EPOCH = dt.datetime(1601, 1, 1, tzinfo=dt.timezone.utc)
+_BANDTIME_MIN = EPOCH
+_BANDTIME_MAX = dt.datetime.max.replace(tzinfo=dt.timezone.utc)
 
 
 class BandTime(Adapter):
     def _decode(self, obj: int, context, path) -> dt.datetime:
-        return EPOCH + dt.timedelta(microseconds=obj // 10)
+        seconds, microseconds = divmod(obj // 10, 1_000_000)
+        return EPOCH + dt.timedelta(seconds=seconds, microseconds=microseconds)
 
     def _encode(self, date: dt.datetime, context, path) -> int:
-        if date > dt.datetime.max.replace(tzinfo=dt.timezone.utc):
+        if date > _BANDTIME_MAX:
             raise ValueError(f"Date {date} too far in the future to be encoded")
 
-        if date < EPOCH:
+        if date < _BANDTIME_MIN:
             raise ValueError(f"Date {date} too far in the past to be encoded")
 
-        return int((date - EPOCH).total_seconds() * 10000000)
+        delta = date - EPOCH
+        return (delta.days * 86400 + delta.seconds) * 10_000_000 + delta.microseconds * 10
 
 
 class BoolAdapter(Adapter):
@@ -72,12 +80,17 @@ class BoolAdapter(Adapter):
         return bool(obj)
 
 
+_GUID_LE_STRUCT = struct.Struct("<IHH8s")
+_GUID_BE_STRUCT = struct.Struct(">IHH8s")
+
+
 class GUIDAdapter(Adapter):
     def _encode(self, guid: uuid.UUID, context, path):
         return guid.bytes_le
 
     def _decode(self, guid: bytes, context, path):
-        return uuid.UUID(bytes_le=guid)
+        # Same reordering as UUID(bytes_le=...), minus its slicing and checks
+        return uuid.UUID(bytes=_GUID_BE_STRUCT.pack(*_GUID_LE_STRUCT.unpack(guid)))
 
 
 class GUIDStringAdapter(Adapter):
@@ -98,24 +111,19 @@ class MeTileAdapter(Adapter):
         self.height = height
 
     def _encode(self, image: Image, context, path):
-        # No packer found from RGB to BGR;16
-        # return image.tobytes("raw", "BGR;16")
-
-        rgb = image.tobytes("raw", "RGB")
-        r = itertools.islice(rgb, 0, None, 3)
-        g = itertools.islice(rgb, 1, None, 3)
-        b = itertools.islice(rgb, 2, None, 3)
-
-        bgr = bytearray(
-            byte
-            for r_value, g_value, b_value in zip(r, g, b)
-            for byte in (
-                ((g_value << 3) & 0b11100000) | (b_value >> 3 & 0b00011111),
-                (r_value & 0b11111000) | ((g_value >> 2) >> 3 & 0b00000111),
-            )
-        )
+        # No packer found from RGB to BGR;16, but Pillow 9 can still convert to the mode itself
+        image = image.convert("RGB")
+        try:
+            return image.convert("BGR;16").tobytes()
+        except ValueError:  # BGR;16 images are no longer supported by newer Pillow
+            pass
 
-        return b"" + bgr
+        rgb = np.frombuffer(image.tobytes("raw", "RGB"), dtype=np.uint8).reshape(-1, 3)
+        r, g, b = (rgb[:, channel].astype(np.uint16) for channel in range(3))
+
+        bgr = ((r & 0b11111000) << 8) | ((g & 0b11111100) << 3) | (b >> 3)
+
+        return bgr.astype("<u2", copy=False).tobytes()
 
     def _decode(self, image: bytes, context, path):
         return Image.frombytes("RGB", (self.width, self.height), image, "raw", "BGR;16")
@@ -159,7 +167,18 @@ class Gender(EnumBase):
 GenderAdapter = IntEnumAdapter(Gender)
 
 
-@dataclasses.dataclass
+def _stack_channels(*channels: np.ndarray) -> np.ndarray:
+    # Interleaves the channels into uint8 pixels, refusing anything a byte can't hold
+    stacked = np.stack(channels, axis=1)
+    if stacked.dtype != np.uint8:
+        if not np.issubdtype(stacked.dtype, np.integer):
+            raise ValueError(f"Colour channels must be integers, not {stacked.dtype}")
+        if stacked.size and (stacked.min() < 0 or stacked.max() > 255):
+            raise ValueError("Colour channels must be between 0 and 255")
+    return stacked.astype(np.uint8, copy=False)
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
 class RGB:
     # TODO: remake as DataclassStruct
 
@@ -176,8 +195,19 @@ class RGB:
     def __repr__(self):
         return f"#{self.red:02X}{self.green:02X}{self.blue:02X}"
 
+    @classmethod
+    def build_many(cls, colours: typing.Iterable["RGB"]) -> bytes:
+        channels = [(colour.red, colour.green, colour.blue) for colour in colours]
+        if not channels:
+            return b""
+        return _stack_channels(*np.array(channels).T).tobytes()
+
+    @staticmethod
+    def build_soa(red: np.ndarray, green: np.ndarray, blue: np.ndarray) -> bytes:
+        return _stack_channels(red, green, blue).tobytes()
+
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True, frozen=True)
 class ARGB(RGB):
     alpha: int = 255
 
@@ -189,16 +219,34 @@ class ARGB(RGB):
     )
 
     def __repr__(self):
-        return f"{super().__repr__()} ({self.alpha/255:.0f}%)"
+        # not super(), slots=True replaces the class so the implicit __class__ cell goes stale
+        return f"{RGB.__repr__(self)} ({self.alpha/255:.0f}%)"
+
+    @classmethod
+    def build_many(cls, colours: typing.Iterable["ARGB"]) -> bytes:
+        channels = [(colour.alpha, colour.red, colour.green, colour.blue) for colour in colours]
+        if not channels:
+            return b""
+        return _stack_channels(*np.array(channels).T).tobytes()
+
+    @staticmethod
+    def build_soa(
+        red: np.ndarray, green: np.ndarray, blue: np.ndarray, alpha: np.ndarray | int = 255
+    ) -> bytes:
+        alpha = np.broadcast_to(alpha, np.shape(red))
+        return _stack_channels(alpha, red, green, blue).tobytes()
+
+
+_ARGB_STRUCT = struct.Struct("<BBBB")
 
 
 class ArgbAdapter(Adapter):
     def _encode(self, obj: ARGB, context, path) -> bytes:
-        return ARGB.struct.build(vars(ARGB), **context)
+        return _ARGB_STRUCT.pack(obj.alpha, obj.red, obj.green, obj.blue)
 
     def _decode(self, obj: bytes, context, path) -> ARGB:
-        parsed = ARGB.struct.parse(obj)
-        return ARGB(alpha=parsed.alpha, red=parsed.red, green=parsed.green, blue=parsed.blue)
+        alpha, red, green, blue = _ARGB_STRUCT.unpack(obj)
+        return ARGB(alpha=alpha, red=red, green=green, blue=blue)
 
 
 ArgbStruct = ArgbAdapter(Bytes(4))
@@ -224,13 +272,79 @@ TileData = Padded(
         "GUID" / GUIDAdapter(Bytes(16)),
         "Order" / Int32ul,
         "ThemeColor" / ArgbStruct,
-        "_NameLength" / Default(Int16ul, construct.len_(this.TileName)),
+        "_NameLength" / Default(Int16ul, lambda ctx: len(ctx.TileName)),
         "SettingsMask" / FlagsEnum(Int16ul, TileSettings),
         "TileName" / PaddedString(this._NameLength * 2, "utf_16_le"),
         "OwnerGUID" / GUIDAdapter(Bytes(16)),
     ),
 )
 
+# TileData up to the name, then the name and OwnerGUID, which follows the name wherever it ends
+_TILE_HEAD_SIZE = 16 + 4 + 4 + 2 + 2
+_TILE_DTYPE = np.dtype(
+    [
+        ("GUID", "V16"),
+        ("Order", "<u4"),
+        ("ThemeColor", "V4"),
+        ("_NameLength", "<u2"),
+        ("SettingsMask", "<u2"),
+        ("_NameAndOwnerGUID", f"V{TileData.sizeof() - _TILE_HEAD_SIZE}"),
+    ]
+)
+
+
+def parse_tiles(data: bytes) -> typing.Dict[str, typing.Union[np.ndarray, typing.List[str]]]:
+    # Column-wise TileData parsing for whole arrays of tiles, GUIDs stay as raw bytes_le
+    tiles = np.frombuffer(data, dtype=_TILE_DTYPE)
+    records = np.frombuffer(data, dtype=np.uint8).reshape(-1, _TILE_DTYPE.itemsize)
+    tails = records[:, _TILE_HEAD_SIZE:]
+    name_lengths = tiles["_NameLength"]
+
+    owner_offsets = name_lengths.astype(np.intp)[:, np.newaxis] * 2 + np.arange(16)
+    if owner_offsets.size and owner_offsets.max() >= tails.shape[1]:
+        raise construct.PaddingError("tile name too long to fit the OwnerGUID")
+    owner_guids = np.take_along_axis(tails, owner_offsets, axis=1)
+
+    # Names are decoded straight out of the buffer, without copying each one out first
+    view = memoryview(data)
+    name_offsets = range(_TILE_HEAD_SIZE, len(view), _TILE_DTYPE.itemsize)
+
+    return {
+        "GUID": tiles["GUID"],
+        "Order": tiles["Order"],
+        "ThemeColor": tiles["ThemeColor"],
+        "_NameLength": name_lengths,
+        "SettingsMask": tiles["SettingsMask"],
+        "TileName": [
+            str(view[offset : offset + length * 2], "utf_16_le").rstrip("\0")
+            for offset, length in zip(name_offsets, name_lengths.tolist())
+        ],
+        "OwnerGUID": owner_guids.view("V16").ravel(),
+    }
+
+
+def build_tiles(tiles: typing.Dict[str, typing.Union[np.ndarray, typing.List[str]]]) -> bytes:
+    # Inverse of parse_tiles, _NameLength is always worked out from TileName
+    names = [name.encode("utf_16_le") for name in tiles["TileName"]]
+    tail_size = _TILE_DTYPE["_NameAndOwnerGUID"].itemsize
+
+    records = np.zeros(len(names), dtype=_TILE_DTYPE)
+    records["GUID"] = tiles["GUID"]
+    records["Order"] = tiles["Order"]
+    records["ThemeColor"] = tiles["ThemeColor"]
+    records["_NameLength"] = [len(name) // 2 for name in names]
+    records["SettingsMask"] = tiles["SettingsMask"]
+
+    name_and_owners = []
+    for name, owner_guid in zip(names, tiles["OwnerGUID"]):
+        name_and_owner = name + bytes(owner_guid)
+        if len(name_and_owner) > tail_size:
+            raise construct.PaddingError("tile name too long to fit the OwnerGUID")
+        name_and_owners.append(name_and_owner.ljust(tail_size, b"\0"))
+    records["_NameAndOwnerGUID"] = np.frombuffer(b"".join(name_and_owners), dtype=f"V{tail_size}")
+
+    return records.tobytes()
+
 
 @dataclasses.dataclass(kw_only=True)
 class BandSystemTime(DataclassMixin):
@@ -245,32 +359,42 @@ class BandSystemTime(DataclassMixin):
     Milliseconds: int = csfield(Default(Int16ul, 0))
 
 
-BandSystemTimeStruct = DataclassStruct(BandSystemTime)
+BandSystemTimeStruct = PrefixedDataclassStruct(BandSystemTime)
+
+
+_BAND_SYSTEM_TIME_STRUCT = struct.Struct("<8H")
+_datetime = dt.datetime
 
 
 class BandSystemDateTimeAdapter(Adapter):
-    def _decode(self, obj: BandSystemTime, context, path) -> dt.datetime:
-        return dt.datetime(
-            year=obj.Year,
-            month=obj.Month,
-            day=obj.Day,
-            hour=obj.Hour,
-            minute=obj.Minute,
-            second=obj.Second,
-            microsecond=obj.Milliseconds * 1000,
+    def _decode(self, obj: bytes, context, path) -> dt.datetime:
+        (
+            year,
+            month,
+            _day_of_week,
+            day,
+            hour,
+            minute,
+            second,
+            milliseconds,
+        ) = _BAND_SYSTEM_TIME_STRUCT.unpack(obj)
+
+        return _datetime(year, month, day, hour, minute, second, milliseconds * 1000)
+
+    def _encode(self, date: dt.datetime, context, path) -> bytes:
+        return _BAND_SYSTEM_TIME_STRUCT.pack(
+            date.year,
+            date.month,
+            date.weekday(),  # TODO: verify, SYSTEMTIME counts from Sunday rather than Monday
+            date.day,
+            date.hour,
+            date.minute,
+            date.second,
+            date.microsecond // 1000,
         )
 
-    def _encode(self, date: dt.datetime, context, path) -> BandSystemTime:
-        return BandSystemTime(
-            Year=date.year,
-            Month=date.month,
-            DayOfWeek=date.weekday(),  # TODO: verify
-            Day=date.day,
-            Hour=date.hour,
-            Minute=date.minute,
-            Second=date.second,
-            Milliseconds=date.microsecond // 1000,
-        )
+
+BandSystemDateTimeStruct = BandSystemDateTimeAdapter(Bytes(BandSystemTimeStruct.sizeof()))
 
 
 Version = construct.Struct(
@@ -330,7 +454,7 @@ class Profile(DataclassMixin):
 
 
 PROFILE_SIZE = 397  # is it???
-ProfileStruct = Padded(PROFILE_SIZE, DataclassStruct(Profile))
+ProfileStruct = Padded(PROFILE_SIZE, PrefixedDataclassStruct(Profile, specialise_on="Version"))
 
 
 @dataclasses.dataclass(kw_only=True)
@@ -343,4 +467,4 @@ class UserProfile(DataclassMixin):
     ReservedData: bytes = csfield(Bytes(256))
 
 
-UserProfileStruct = DataclassStruct(UserProfile)
+UserProfileStruct = PrefixedDataclassStruct(UserProfile)
@@ -1,8 +1,30 @@
 import enum
+import struct
 import typing
+import functools
 import itertools
-from construct import Adapter, Default
-from construct_typed import EnumBase as _EnumBase, csfield as _csfield
+from construct import (
+    Adapter,
+    Default,
+    Container,
+    FormatField,
+    Renamed,
+    IfThenElse,
+    Pass,
+    Bytes,
+    Flag,
+    StringEncoded,
+    FixedSized,
+    NullStripped,
+    PaddingError,
+    StreamError,
+    StringError,
+    FormatFieldError,
+    stream_read,
+    stream_write,
+)
+from construct.core import evaluate
+from construct_typed import EnumBase as _EnumBase, DataclassStruct, csfield as _csfield
 from construct_typed.dataclass_struct import Construct, ParsedType, Context
 
 K = typing.TypeVar("K")
@@ -16,12 +38,18 @@ class EnumBase(_EnumBase):
         return None
 
 
+@functools.lru_cache(maxsize=None)
 def IntEnumAdapter(base_enum: E) -> typing.Type[Adapter]:
+    members = {member.value: member for member in base_enum}
+
     def _encode(self, obj: E, context, path) -> int:
         return obj
 
     def _decode(self, obj: int, context, path) -> E:
-        return base_enum(obj)
+        member = members.get(obj)
+        if member is None:
+            return base_enum(obj)  # keep the usual error for unknown values
+        return member
 
     return type(
         f"{base_enum.__name__}Adapter",
@@ -54,6 +82,247 @@ def csfield(
     return field
 
 
+_FieldCodec = typing.Tuple[
+    str,
+    typing.Callable[[t.Any, Context, str], t.Any],
+    typing.Callable[[t.Any, Context, str], t.Any],
+]
+
+
+def _passthrough(obj, context, path):
+    return obj
+
+
+def _fixed_codec(subcon: Construct) -> typing.Optional[_FieldCodec]:
+    # Maps a fixed-size subcon onto a struct format, plus what turns the unpacked value into
+    # the parsed value and back; None for anything that needs construct's own machinery
+    if isinstance(subcon, Renamed):
+        return _fixed_codec(subcon.subcon)
+
+    if isinstance(subcon, FormatField):
+        if subcon.fmtstr[0] != "<":
+            return None
+        return subcon.fmtstr[1:], _passthrough, _passthrough
+
+    if subcon is Flag:
+        return "?", _passthrough, _passthrough
+
+    if isinstance(subcon, Bytes) and isinstance(subcon.length, int):
+        length = subcon.length
+
+        def _encode(obj, context, path):
+            if len(obj) != length:
+                raise StreamError(
+                    f"bytes object of wrong length, expected {length}, found {len(obj)}", path=path
+                )
+            return obj
+
+        return f"{length}s", _passthrough, _encode
+
+    if (
+        isinstance(subcon, StringEncoded)
+        and isinstance(subcon.subcon, FixedSized)
+        and isinstance(subcon.subcon.length, int)
+        and isinstance(subcon.subcon.subcon, NullStripped)
+    ):
+        length, encoding = subcon.subcon.length, subcon.encoding
+
+        def _decode(obj, context, path):
+            return obj.decode(encoding).rstrip("\0")
+
+        def _encode(obj, context, path):
+            if not isinstance(obj, str):
+                raise StringError("string encoding failed, expected unicode string", path=path)
+            data = obj.encode(encoding)
+            if len(data) > length:
+                raise PaddingError(
+                    f"string needs {len(data)} bytes, only {length} allowed", path=path
+                )
+            return data
+
+        return f"{length}s", _decode, _encode
+
+    if isinstance(subcon, Default) and not callable(subcon.value):
+        inner = _fixed_codec(subcon.subcon)
+        if inner is None:
+            return None
+        inner_format, inner_decode, inner_encode = inner
+        default = subcon.value
+
+        def _encode(obj, context, path):
+            return inner_encode(default if obj is None else obj, context, path)
+
+        return inner_format, inner_decode, _encode
+
+    if isinstance(subcon, Adapter):
+        inner = _fixed_codec(subcon.subcon)
+        if inner is None:
+            return None
+        inner_format, inner_decode, inner_encode = inner
+
+        def _decode(obj, context, path):
+            return subcon._decode(inner_decode(obj, context, path), context, path)
+
+        def _encode(obj, context, path):
+            return inner_encode(subcon._encode(obj, context, path), context, path)
+
+        return inner_format, _decode, _encode
+
+    return None
+
+
+class _FixedLayout(typing.NamedTuple):
+    fixed_struct: struct.Struct  # packs every fixed-size field in one go
+    names: typing.Tuple[str, ...]
+    formats: typing.Tuple[str, ...]
+    decoders: typing.Tuple[typing.Callable[[t.Any, Context, str], t.Any], ...]
+    encoders: typing.Tuple[typing.Callable[[t.Any, Context, str], t.Any], ...]
+    rest: typing.Tuple[typing.Tuple[str, Construct], ...]  # whatever follows, left to construct
+
+
+def _split_fixed_prefix(subcons: typing.Iterable[Construct], rest: bool = True) -> _FixedLayout:
+    # Packs the leading run of fixed-size fields into one struct.Struct, leaving the rest to be
+    # parsed/built by construct as usual (or out entirely); compiled subcons skip construct's
+    # length checks, so the rest are deliberately not compiled
+    prefix = []
+    subcons = list(subcons)
+    while subcons and subcons[0].name:
+        codec = _fixed_codec(subcons[0])
+        if codec is None:
+            break
+        prefix.append((subcons.pop(0).name, codec))
+
+    return _FixedLayout(
+        fixed_struct=struct.Struct(
+            "<" + "".join(field_format for _, (field_format, _, _) in prefix)
+        ),
+        names=tuple(name for name, _ in prefix),
+        formats=tuple(field_format for _, (field_format, _, _) in prefix),
+        decoders=tuple(decode for _, (_, decode, _) in prefix),
+        encoders=tuple(encode for _, (_, _, encode) in prefix),
+        rest=tuple((subcon.name, subcon) for subcon in subcons) if rest else (),
+    )
+
+
+def _resolve(subcon: Construct, context: Container) -> Construct:
+    if isinstance(subcon, Renamed):
+        return Renamed(_resolve(subcon.subcon, context), newname=subcon.name)
+    if isinstance(subcon, IfThenElse):
+        if evaluate(subcon.condfunc, context):
+            return subcon.thensubcon
+        return subcon.elsesubcon
+    return subcon
+
+
+class PrefixedDataclassStruct(DataclassStruct):
+    # A DataclassStruct that packs its leading fixed-size fields with a single struct.Struct, and
+    # only hands whatever follows to construct
+    #
+    # With specialise_on, the If fields after that are resolved once per value of that (leading)
+    # field and the resulting layout is cached, so their conditions must only depend on it
+
+    def __init__(self, dc_type, reverse: bool = False, specialise_on: typing.Optional[str] = None):
+        super().__init__(dc_type, reverse)
+        self.specialise_on = specialise_on
+        self.specialised_tails = {}
+
+        subcons = self.subcon.subcons
+        self.prefix = _split_fixed_prefix(subcons, rest=specialise_on is None)
+        self.tail_subcons = subcons[len(self.prefix.names) :]
+        self.tail_names = tuple(subcon.name for subcon in self.tail_subcons)
+
+    @staticmethod
+    def _struct_context(context: Context, stream) -> Container:
+        # Same context Struct gives its fields, so this.Version and friends work in the tail
+        struct_context = Container(
+            _=context,
+            _params=context._params,
+            _root=None,
+            _parsing=context._parsing,
+            _building=context._building,
+            _sizing=context._sizing,
+            _io=stream,
+            _index=context.get("_index", None),
+        )
+        struct_context._root = context.get("_root", struct_context)
+        return struct_context
+
+    def _tail(self, struct_context: Container) -> typing.Optional[_FixedLayout]:
+        if self.specialise_on is None:
+            return None
+
+        key = struct_context[self.specialise_on]
+        tail = self.specialised_tails.get(key)
+        if tail is None:
+            # Fields that resolve to Pass are left out altogether, _parse fills them in as None
+            resolved = (_resolve(subcon, struct_context) for subcon in self.tail_subcons)
+            tail = self.specialised_tails[key] = _split_fixed_prefix(
+                subcon for subcon in resolved if getattr(subcon, "subcon", None) is not Pass
+            )
+        return tail
+
+    @staticmethod
+    def _parse_layout(layout: _FixedLayout, stream, struct_context: Container, path):
+        if layout.names:
+            fixed_struct = layout.fixed_struct
+            values = fixed_struct.unpack(stream_read(stream, fixed_struct.size, path))
+            for name, decode, value in zip(layout.names, layout.decoders, values):
+                struct_context[name] = decode(value, struct_context, f"{path} -> {name}")
+
+        # The rest are Renamed, which add their own name to the path
+        for name, subcon in layout.rest:
+            struct_context[name] = subcon._parsereport(stream, struct_context, path)
+
+    @staticmethod
+    def _build_layout(layout: _FixedLayout, stream, struct_context: Container, path):
+        if layout.names:
+            values = [
+                encode(struct_context[name], struct_context, f"{path} -> {name}")
+                for name, encode in zip(layout.names, layout.encoders)
+            ]
+            try:
+                data = layout.fixed_struct.pack(*values)
+            except struct.error:
+                # Find the field that didn't fit, to report it the same way FormatField would
+                for name, field_format, value in zip(layout.names, layout.formats, values):
+                    fmtstr = "<" + field_format
+                    try:
+                        struct.pack(fmtstr, value)
+                    except struct.error:
+                        raise FormatFieldError(
+                            f"struct {fmtstr!r} error during building, given value {value!r}",
+                            path=f"{path} -> {name}",
+                        )
+                raise
+            stream_write(stream, data, layout.fixed_struct.size, path)
+
+        for name, subcon in layout.rest:
+            struct_context[name] = subcon._build(struct_context[name], stream, struct_context, path)
+
+    def _parse(self, stream, context, path):
+        struct_context = self._struct_context(context, stream)
+        self._parse_layout(self.prefix, stream, struct_context, path)
+
+        tail = self._tail(struct_context)
+        if tail is not None:
+            for name in self.tail_names:
+                struct_context[name] = None
+            self._parse_layout(tail, stream, struct_context, path)
+
+        return self._decode(struct_context, context, path)
+
+    def _build(self, obj, stream, context, path):
+        struct_context = self._struct_context(context, stream)
+        struct_context.update(self._encode(obj, context, path))
+        self._build_layout(self.prefix, stream, struct_context, path)
+
+        tail = self._tail(struct_context)
+        if tail is not None:
+            self._build_layout(tail, stream, struct_context, path)
+
+        return obj
+
+
 def or_strict(*args: V) -> typing.Optional[V]:
     for non_none_result in args:
         if non_none_result is not None:
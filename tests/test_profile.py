@@ -0,0 +1,171 @@
+import uuid
+import pytest
+import construct
+import dataclasses
+import datetime as dt
+from construct import Int8ul, Int16ul, Bytes, If, Padded, this
+from construct_typed import DataclassMixin, DataclassStruct
+from msband.sugar import PrefixedDataclassStruct, csfield
+from msband.static import (
+    Profile,
+    ProfileStruct,
+    PROFILE_SIZE,
+    Gender,
+    LocaleId,
+    Language,
+    DisplayTimeFormat,
+    DisplayDateFormat,
+    UnitType,
+)
+
+BAND_VERSION_2_FIELDS = dict(
+    HwagChangeTime=dt.datetime(2021, 1, 2, tzinfo=dt.timezone.utc),
+    HwagChangeAgent=1,
+    DeviceNameChangeTime=dt.datetime(2021, 1, 3, tzinfo=dt.timezone.utc),
+    DeviceNameChangeAgent=2,
+    LocaleSettingsChangeTime=dt.datetime(2021, 1, 4, tzinfo=dt.timezone.utc),
+    LocaleSettingsChangeAgent=3,
+    LanguageChangeTime=dt.datetime(2021, 1, 5, tzinfo=dt.timezone.utc),
+    LanguageChangeAgent=4,
+    MaxHR=190,
+)
+
+
+def make_profile(version: int, **overrides) -> Profile:
+    fields = dict(
+        Version=version,
+        LastSync=dt.datetime(2022, 1, 1, 12, 30, 15, 123456, tzinfo=dt.timezone.utc),
+        UserGUID=uuid.UUID(hex="d8895bfd-0461-400d-bd52-dbe2a3c33021"),
+        Birthday=dt.datetime(1990, 1, 1, tzinfo=dt.timezone.utc),
+        Weight_g=70000,
+        Height_mm=1800,
+        Gender=Gender.Female,
+        DeviceName="Band",
+        LocaleName="en-GB",
+        LocaleId=list(LocaleId)[0],
+        Language=list(Language)[0],
+        DateSeparator="/",
+        NumberSeparator=",",
+        DecimalSeparator=".",
+        TimeFormat=list(DisplayTimeFormat)[0],
+        DateFormat=list(DisplayDateFormat)[0],
+        DistanceShortUnits=list(UnitType)[0],
+        DistanceLongUnits=list(UnitType)[1],
+        MassUnits=list(UnitType)[0],
+        VolumeUnits=list(UnitType)[0],
+        EnergyUnits=list(UnitType)[0],
+        TemperatureUnits=list(UnitType)[0],
+        RunDisplayUnits=list(UnitType)[0],
+        Telemetry=True,
+        ReservedData=b"\x01\x02",
+        **(BAND_VERSION_2_FIELDS if version >= 2 else dict.fromkeys(BAND_VERSION_2_FIELDS)),
+    )
+    fields.update(overrides)
+    return Profile(**fields)
+
+
+# The plain construct equivalent, to check the fast path against
+ReferenceProfileStruct = Padded(PROFILE_SIZE, DataclassStruct(Profile))
+
+
+@pytest.mark.parametrize("version", [1, 2, 3])
+def test_profile_round_trip(version):
+    profile = make_profile(version)
+    data = ProfileStruct.build(profile)
+
+    assert len(data) == PROFILE_SIZE
+    assert data == ReferenceProfileStruct.build(profile)
+
+    parsed = ProfileStruct.parse(data)
+    assert parsed == ReferenceProfileStruct.parse(data)
+    assert ProfileStruct.build(parsed) == data
+
+    assert parsed.ReservedData.startswith(profile.ReservedData)
+    parsed.ReservedData = profile.ReservedData
+    assert parsed == profile
+
+
+def test_profile_version_1_skips_optional_fields():
+    data = ProfileStruct.build(make_profile(1, **BAND_VERSION_2_FIELDS))
+    parsed = ProfileStruct.parse(data)
+
+    assert data == ProfileStruct.build(make_profile(1))
+    assert all(getattr(parsed, name) is None for name in BAND_VERSION_2_FIELDS)
+
+
+@pytest.mark.parametrize(
+    "version, field, value, error",
+    [
+        (2, "Weight_g", -1, construct.FormatFieldError),
+        (2, "Height_mm", 70000, construct.FormatFieldError),
+        (2, "Version", None, construct.FormatFieldError),
+        (2, "MaxHR", 300, construct.FormatFieldError),
+        (2, "DeviceName", "x" * 17, construct.PaddingError),
+        (2, "DeviceName", 5, construct.StringError),
+    ],
+)
+def test_profile_build_errors_name_the_field(version, field, value, error):
+    with pytest.raises(error, match=f"-> {field}"):
+        ProfileStruct.build(make_profile(version, **{field: value}))
+
+
+@dataclasses.dataclass(kw_only=True)
+class Sample(DataclassMixin):
+    Count: int = csfield(Int8ul)
+    Flags: int = csfield(Int16ul)
+    Extra: int = csfield(If(this.Count > 1, Int16ul))
+    Tail: bytes = csfield(Bytes(this.Count))
+
+
+@pytest.mark.parametrize("specialise_on", [None, "Count"])
+@pytest.mark.parametrize("count", [0, 1, 3])
+def test_prefixed_dataclass_struct_matches_dataclass_struct(specialise_on, count):
+    sample = Sample(Count=count, Flags=0x1234, Extra=7 if count > 1 else None, Tail=b"x" * count)
+    fast = PrefixedDataclassStruct(Sample, specialise_on=specialise_on)
+    reference = DataclassStruct(Sample)
+
+    data = fast.build(sample)
+    assert data == reference.build(sample)
+    assert fast.parse(data) == reference.parse(data) == sample
+
+
+@pytest.mark.parametrize("specialise_on", [None, "Count"])
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\x03\x34\x12\x07\x00xy",  # Tail one byte short
+        b"\x03\x34\x12\x07",  # Extra cut in half
+        b"\x03\x34",  # inside the fixed prefix
+        b"",
+    ],
+)
+def test_prefixed_dataclass_struct_rejects_truncated_input(specialise_on, data):
+    fast = PrefixedDataclassStruct(Sample, specialise_on=specialise_on)
+
+    with pytest.raises(construct.StreamError):
+        DataclassStruct(Sample).parse(data)
+    with pytest.raises(construct.StreamError):
+        fast.parse(data)
+
+
+@pytest.mark.parametrize("specialise_on", [None, "Count"])
+@pytest.mark.parametrize("tail", [b"x", b"xyzw"])
+def test_prefixed_dataclass_struct_rejects_wrong_length_bytes(specialise_on, tail):
+    sample = Sample(Count=3, Flags=0x1234, Extra=7, Tail=tail)
+    fast = PrefixedDataclassStruct(Sample, specialise_on=specialise_on)
+
+    with pytest.raises(construct.StreamError):
+        DataclassStruct(Sample).build(sample)
+    with pytest.raises(construct.StreamError, match="-> Tail"):
+        fast.build(sample)
+
+
+@pytest.mark.parametrize("version", [1, 2, 3])
+def test_profile_rejects_truncated_input(version):
+    data = ProfileStruct.build(make_profile(version))
+
+    for size in (0, 1, len(data) // 2, len(data) - 1):
+        with pytest.raises(construct.StreamError):
+            ReferenceProfileStruct.parse(data[:size])
+        with pytest.raises(construct.StreamError):
+            ProfileStruct.parse(data[:size])
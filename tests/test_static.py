@@ -0,0 +1,254 @@
+import uuid
+import pytest
+import itertools
+import numpy as np
+import construct
+import dataclasses
+import datetime as dt
+from PIL import Image
+from construct_typed import DataclassStruct
+from msband.static import (
+    ARGB,
+    RGB,
+    ArgbStruct,
+    BandSystemTime,
+    BandSystemTimeStruct,
+    MeTileAdapter,
+    TileData,
+    TileSettings,
+    UserProfile,
+    UserProfileStruct,
+    build_tiles,
+    parse_tiles,
+)
+
+
+def make_user_profile(**overrides) -> UserProfile:
+    return dataclasses.replace(
+        UserProfile(
+            Version=1,
+            LastSync=dt.datetime(2021, 1, 2, 3, 4, 5, tzinfo=dt.timezone.utc),
+            UserGUID=uuid.UUID("12345678-9abc-def0-1234-56789abcdef0"),
+            ReservedData=bytes(range(256)),
+        ),
+        **overrides,
+    )
+
+
+SYSTEM_TIME = BandSystemTime(
+    Year=2021, Month=1, DayOfWeek=6, Day=2, Hour=3, Minute=4, Second=5, Milliseconds=6
+)
+
+
+@pytest.mark.parametrize(
+    "fast, reference, value",
+    [
+        (UserProfileStruct, DataclassStruct(UserProfile), make_user_profile()),
+        (BandSystemTimeStruct, DataclassStruct(BandSystemTime), SYSTEM_TIME),
+    ],
+)
+def test_fixed_struct_round_trip(fast, reference, value):
+    data = fast.build(value)
+
+    assert data == reference.build(value)
+    assert fast.parse(data) == reference.parse(data) == value
+
+
+@pytest.mark.parametrize(
+    "fast, reference, value",
+    [
+        (UserProfileStruct, DataclassStruct(UserProfile), make_user_profile()),
+        (BandSystemTimeStruct, DataclassStruct(BandSystemTime), SYSTEM_TIME),
+    ],
+)
+def test_fixed_struct_rejects_truncated_input(fast, reference, value):
+    data = reference.build(value)
+
+    for size in (0, 1, len(data) // 2, len(data) - 1):
+        with pytest.raises(construct.StreamError):
+            reference.parse(data[:size])
+        with pytest.raises(construct.StreamError):
+            fast.parse(data[:size])
+
+
+def test_user_profile_rejects_short_input():
+    with pytest.raises(construct.StreamError):
+        UserProfileStruct.parse(b"\x01" * 100)
+
+
+@pytest.mark.parametrize("reserved", [b"", b"x", bytes(255), bytes(257)])
+def test_user_profile_rejects_wrong_length_reserved_data(reserved):
+    profile = make_user_profile(ReservedData=reserved)
+
+    with pytest.raises(construct.StreamError):
+        DataclassStruct(UserProfile).build(profile)
+    with pytest.raises(construct.StreamError, match="-> ReservedData"):
+        UserProfileStruct.build(profile)
+
+
+@pytest.mark.parametrize("field, value", [("Year", 70000), ("Milliseconds", -1)])
+def test_band_system_time_rejects_out_of_range_fields(field, value):
+    system_time = dataclasses.replace(SYSTEM_TIME, **{field: value})
+
+    with pytest.raises(construct.FormatFieldError):
+        DataclassStruct(BandSystemTime).build(system_time)
+    with pytest.raises(construct.FormatFieldError, match=f"-> {field}"):
+        BandSystemTimeStruct.build(system_time)
+
+
+TILE_SETTINGS = construct.FlagsEnum(construct.Int16ul, TileSettings)
+TILE_NAMES = ["", "Run", "x" * 22, "Läufe", "日本語", "\U0001f3c3 Run"]
+
+
+def make_tile(index: int, name: str) -> dict:
+    return dict(
+        GUID=uuid.UUID(int=0x0123456789ABCDEF << 64 | index),
+        Order=index,
+        ThemeColor=ARGB(alpha=index, red=0x12, green=0x34, blue=0x56),
+        # TileData counts code points, the band counts UTF-16 code units
+        _NameLength=len(name.encode("utf_16_le")) // 2,
+        SettingsMask=TileSettings.EnableNotification.value + TileSettings.EnableBadging.value,
+        TileName=name,
+        OwnerGUID=uuid.UUID(int=0xFEDCBA9876543210 << 64 | index),
+    )
+
+
+def build_reference_tiles(names) -> bytes:
+    return b"".join(TileData.build(make_tile(index, name)) for index, name in enumerate(names))
+
+
+@pytest.mark.parametrize("names", [[], *([name] for name in TILE_NAMES), TILE_NAMES], ids=repr)
+def test_tiles_match_tile_data(names):
+    data = build_reference_tiles(names)
+    tiles = parse_tiles(data)
+    reference = construct.GreedyRange(TileData).parse(data)
+
+    assert len(tiles["TileName"]) == len(reference)
+    for index, tile in enumerate(reference):
+        assert uuid.UUID(bytes_le=bytes(tiles["GUID"][index])) == tile.GUID
+        assert tiles["Order"][index] == tile.Order
+        assert ArgbStruct.parse(bytes(tiles["ThemeColor"][index])) == tile.ThemeColor
+        assert tiles["_NameLength"][index] == tile._NameLength
+        assert TILE_SETTINGS.parse(bytes(tiles["SettingsMask"][index : index + 1])) == (
+            tile.SettingsMask
+        )
+        assert tiles["TileName"][index] == tile.TileName
+        assert uuid.UUID(bytes_le=bytes(tiles["OwnerGUID"][index])) == tile.OwnerGUID
+
+    assert build_tiles(tiles) == data
+
+
+def test_tiles_empty_buffer():
+    tiles = parse_tiles(b"")
+
+    assert tiles["TileName"] == []
+    assert all(len(column) == 0 for column in tiles.values())
+    assert build_tiles(tiles) == b""
+
+
+def test_parse_tiles_rejects_name_overlapping_owner_guid():
+    data = bytearray(build_reference_tiles(["Run", "Run"]))
+    data[24:26] = (23).to_bytes(2, "little")  # first tile's _NameLength
+
+    with pytest.raises(construct.PaddingError):
+        TileData.parse(data)
+    with pytest.raises(construct.PaddingError):
+        parse_tiles(bytes(data))
+    with pytest.raises(construct.PaddingError):
+        parse_tiles(bytes(data[: TileData.sizeof()]))
+
+
+@pytest.mark.parametrize("name", ["x" * 23, "\U0001f3c3" * 12])
+def test_build_tiles_rejects_name_overlapping_owner_guid(name):
+    tiles = parse_tiles(build_reference_tiles(["Run"]))
+    tiles["TileName"] = [name]
+
+    with pytest.raises(construct.PaddingError):
+        TileData.build(make_tile(0, name))
+    with pytest.raises(construct.PaddingError):
+        build_tiles(tiles)
+
+
+def pack_bgr16_per_pixel(image: Image.Image) -> bytes:
+    # The original MeTileAdapter packing, one pixel at a time
+    rgb = image.convert("RGB").tobytes("raw", "RGB")
+    r = itertools.islice(rgb, 0, None, 3)
+    g = itertools.islice(rgb, 1, None, 3)
+    b = itertools.islice(rgb, 2, None, 3)
+
+    return bytes(
+        byte
+        for r_value, g_value, b_value in zip(r, g, b)
+        for byte in (
+            ((g_value << 3) & 0b11100000) | (b_value >> 3 & 0b00011111),
+            (r_value & 0b11111000) | ((g_value >> 2) >> 3 & 0b00000111),
+        )
+    )
+
+
+def make_me_tile_image(mode: str) -> Image.Image:
+    # Every byte value in every channel, on a size that isn't a multiple of anything
+    width, height = 37, 23
+    data = bytes(
+        (index * 7 + channel * 85) & 0xFF for index in range(width * height) for channel in range(3)
+    )
+    image = Image.frombytes("RGB", (width, height), data)
+    if mode == "P":
+        return image.quantize(256)
+    return image.convert(mode)
+
+
+@pytest.fixture(params=["pillow", "numpy"])
+def me_tile_packing(request, monkeypatch):
+    if request.param == "pillow":
+        try:
+            Image.new("RGB", (1, 1)).convert("BGR;16")
+        except ValueError:
+            pytest.skip("this Pillow can't convert to BGR;16")
+        return
+
+    convert = Image.Image.convert
+
+    def convert_without_bgr16(self, mode=None, *args, **kwargs):
+        if mode == "BGR;16":
+            raise ValueError("conversion from RGB to BGR;16 not supported")
+        return convert(self, mode, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "convert", convert_without_bgr16)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "P"])
+def test_me_tile_encode_matches_per_pixel_packing(me_tile_packing, mode):
+    image = make_me_tile_image(mode)
+    adapter = MeTileAdapter(construct.GreedyBytes, *image.size)
+
+    assert adapter._encode(image, None, "") == pack_bgr16_per_pixel(image)
+
+
+COLOURS = [(0, 0, 0), (255, 255, 255), (0x12, 0x34, 0x56), (1, 128, 254)]
+
+
+def test_colours_build_many_matches_struct():
+    rgbs = [RGB(*colour) for colour in COLOURS]
+    argbs = [ARGB(*colour, alpha=index) for index, colour in enumerate(COLOURS)]
+    red, green, blue = (np.array(channel) for channel in zip(*COLOURS))
+
+    assert RGB.build_many(rgbs) == b"".join(
+        RGB.struct.build(dataclasses.asdict(rgb)) for rgb in rgbs
+    )
+    assert RGB.build_soa(red, green, blue) == RGB.build_many(rgbs)
+    assert ARGB.build_many(argbs) == b"".join(map(ArgbStruct.build, argbs))
+    assert ARGB.build_soa(red, green, blue, np.arange(len(COLOURS))) == ARGB.build_many(argbs)
+    assert RGB.build_many([]) == ARGB.build_many([]) == b""
+
+
+@pytest.mark.parametrize("value", [-1, 256, 1.5])
+@pytest.mark.parametrize("colour_type", [RGB, ARGB])
+def test_colours_reject_out_of_range_channels(colour_type, value):
+    colours = [*COLOURS, (value, 0, 0)]
+    red, green, blue = (np.array(channel) for channel in zip(*colours))
+
+    with pytest.raises(ValueError) as soa_error:
+        colour_type.build_soa(red, green, blue)
+    with pytest.raises(ValueError, match=str(soa_error.value)):
+        colour_type.build_many([colour_type(*colour) for colour in colours])